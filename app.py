@@ -1,23 +1,146 @@
 from flask import Flask, jsonify, request, render_template
 from flask_cors import CORS
+import os
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from changelog import CHANGE_TRACKED_TABLES, current_seq
+from jobs import JobScheduler
+from recommendations import cached_recommendations, student_recommendation
+from writes import DatabaseBusy, run_write
 
 app = Flask(__name__)
 CORS(app)
 app.config['DATABASE'] = 'students.db'
+# Campus key -> SQLite file. The first entry is the default shard and also
+# holds the reference copy of the courses table.
+app.config['SHARDS'] = {'main': app.config['DATABASE']}
+# Optional routing rules: course id -> campus key, department -> campus key.
+# Students whose course matches neither rule land on the default shard.
+app.config['COURSE_SHARDS'] = {}
+app.config['DEPARTMENT_SHARDS'] = {}
+# Optional callable receiving every SQL statement executed (see benchmark.py)
+app.config['SQL_TRACE'] = None
+# Run background jobs in this process (benchmark.py and stress_writes.py
+# turn it off so jobs do not run against their temporary databases)
+app.config['RUN_JOBS'] = True
 
+# Shared pool used to query all shards in parallel for list/analytics routes
+shard_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='shard')
 
-def get_db_connection():
-    """Create and return a database connection."""
-    conn = sqlite3.connect(app.config['DATABASE'])
+
+def default_shard():
+    """Return the campus key of the default shard."""
+    return next(iter(app.config['SHARDS']))
+
+
+def get_db_connection(shard=None):
+    """Create and return a connection to a shard (default shard if None)."""
+    path = app.config['SHARDS'].get(shard or default_shard())
+    if path is None:
+        raise KeyError(f"Unknown shard: {shard}")
+    conn = sqlite3.connect(path)
     conn.row_factory = sqlite3.Row
+    if app.config['SQL_TRACE']:
+        conn.set_trace_callback(app.config['SQL_TRACE'])
     return conn
 
 
+def fan_out(query):
+    """Run query(conn) on every shard in parallel.
+
+    Returns a dict mapping campus key -> query result.
+    """
+    def run(shard):
+        conn = get_db_connection(shard)
+        try:
+            return query(conn)
+        finally:
+            conn.close()
+
+    shards = list(app.config['SHARDS'])
+    if len(shards) == 1:
+        return {shards[0]: run(shards[0])}
+    return dict(zip(shards, shard_pool.map(run, shards)))
+
+
+def shard_for_course(course_id, department=None):
+    """Pick the shard that owns students of the given course."""
+    course_shards = app.config['COURSE_SHARDS']
+    if course_id in course_shards:
+        return course_shards[course_id]
+    department_shards = app.config['DEPARTMENT_SHARDS']
+    if department_shards:
+        if department is None and course_id is not None:
+            conn = get_db_connection()
+            row = conn.execute(
+                'SELECT department FROM courses WHERE id = ?', (course_id,)
+            ).fetchone()
+            conn.close()
+            department = row['department'] if row else None
+        if department in department_shards:
+            return department_shards[department]
+    return default_shard()
+
+
+def find_student_shard(student_id):
+    """Return the shard holding the student, or None if no shard has it.
+
+    A ``campus`` query parameter is checked first so a correct hint skips
+    the lookup across shards; a wrong hint falls back to that lookup.
+    """
+    def exists(conn):
+        return conn.execute(
+            'SELECT 1 FROM students WHERE id = ?', (student_id,)
+        ).fetchone() is not None
+
+    campus = request.args.get('campus')
+    if campus in app.config['SHARDS']:
+        conn = get_db_connection(campus)
+        try:
+            if exists(conn):
+                return campus
+        finally:
+            conn.close()
+    for shard, found in fan_out(exists).items():
+        if found:
+            return shard
+    return None
+
+
+def owning_shard(student_id):
+    """Shard that writes for a student go to (default shard if unknown)."""
+    return find_student_shard(student_id) or default_shard()
+
+
+def write_to_shard(shard, work):
+    """Run work(conn) as one IMMEDIATE transaction on a shard, retrying busy."""
+    result = run_write(lambda: get_db_connection(shard), work)
+    refresh_recommendations_later()
+    return result
+
+
+# Primary keys are only unique within a shard: adding a student checks
+# every shard and inserts while holding this lock
+student_ids_lock = threading.Lock()
+
+# Background jobs are persisted in the default shard
+scheduler = JobScheduler(get_db_connection)
+
+
 def init_database():
-    """Initialize the database with sample data."""
-    conn = get_db_connection()
+    """Initialize every shard with the schema and its share of sample data."""
+    for shard in app.config['SHARDS']:
+        init_shard(shard)
+    scheduler.create_table()
+
+
+def init_shard(shard):
+    """Initialize one shard with the schema and the sample rows it owns."""
+    conn = get_db_connection(shard)
+    # WAL lets readers proceed while a writer holds the lock
+    conn.execute('PRAGMA journal_mode=WAL')
     # Drop existing tables if they exist
     conn.execute('DROP TABLE IF EXISTS students')
     conn.execute('DROP TABLE IF EXISTS assignments')
@@ -33,7 +156,8 @@ def init_database():
         phone TEXT,
         course_id INTEGER,
         performance TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        version INTEGER NOT NULL DEFAULT 1
     )''')
 
     conn.execute('''CREATE TABLE courses (
@@ -68,6 +192,61 @@ def init_database():
         FOREIGN KEY (student_id) REFERENCES students (id)
     )''')
 
+    # Indexes for per-student lookups, course joins and recent activity
+    conn.execute('CREATE INDEX idx_students_course ON students (course_id)')
+    conn.execute(
+        'CREATE INDEX idx_assignments_student '
+        'ON assignments (student_id, assignment_date)'
+    )
+    conn.execute(
+        'CREATE INDEX idx_assignments_date ON assignments (assignment_date)'
+    )
+    conn.execute(
+        'CREATE INDEX idx_semesters_student ON semesters (student_id, semester)'
+    )
+    conn.execute(
+        'CREATE INDEX idx_attendance_student '
+        'ON attendance (student_id, date, present)'
+    )
+
+    # Change log: triggers record every write (including direct DB writes)
+    # with a monotonically increasing seq that sync clients resume from
+    conn.execute('''CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_key TEXT NOT NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS change_log (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        floor INTEGER NOT NULL
+    )''')
+    # Dropping the tables bypassed the triggers, so every older cursor is
+    # stale: consume one seq and make it the floor, forcing clients to reset
+    floor = current_seq(conn) + 1
+    conn.execute('DELETE FROM changes')
+    if not conn.execute(
+        "UPDATE sqlite_sequence SET seq = ? WHERE name = 'changes'", (floor,)
+    ).rowcount:
+        conn.execute(
+            "INSERT INTO sqlite_sequence (name, seq) VALUES ('changes', ?)",
+            (floor,)
+        )
+    conn.execute(
+        'INSERT OR REPLACE INTO change_log (id, floor) VALUES (1, ?)', (floor,)
+    )
+    for table in CHANGE_TRACKED_TABLES:
+        for event, keys in (('INSERT', ['NEW']), ('UPDATE', ['OLD', 'NEW']),
+                            ('DELETE', ['OLD'])):
+            statements = ''.join(
+                f"INSERT INTO changes (table_name, row_key) "
+                f"VALUES ('{table}', {key}.id);"
+                for key in keys
+            )
+            conn.execute(f'''CREATE TRIGGER {table}_{event.lower()}_changes
+                AFTER {event} ON {table}
+                BEGIN {statements} END''')
+
     # Insert sample data
     courses = [
         ('B.Tech CSE', 'Computer Science'),
@@ -106,6 +285,12 @@ def init_database():
             'Excellent'
         )
     ]
+    department_of = {i + 1: course[1] for i, course in enumerate(courses)}
+    sample_students = [
+        student for student in sample_students
+        if shard_for_course(student[4], department_of[student[4]]) == shard
+    ]
+    owned = {student[0] for student in sample_students}
     conn.executemany(
         'INSERT INTO students (id, name, email, phone, course_id, performance) '
         'VALUES (?, ?, ?, ?, ?, ?)',
@@ -123,6 +308,7 @@ def init_database():
         ('priya004', 'DBMS', 94, 100, '2024-01-15'),
         ('priya004', 'CN', 91, 100, '2024-01-20')
     ]
+    assignments = [a for a in assignments if a[0] in owned]
     conn.executemany(
         (
             'INSERT INTO assignments (student_id, subject, score, max_score, '
@@ -142,6 +328,7 @@ def init_database():
         ('priya004', 1, 9.0), ('priya004', 2, 9.2), ('priya004', 3, 9.3),
         ('priya004', 4, 9.4), ('priya004', 5, 9.4), ('priya004', 6, 9.5)
     ]
+    semesters = [row for row in semesters if row[0] in owned]
     conn.executemany(
         'INSERT INTO semesters (student_id, semester, cgpa) VALUES (?, ?, ?)',
         semesters
@@ -150,7 +337,8 @@ def init_database():
     # Insert attendance data (sample for last 30 days)
     import random
     from datetime import timedelta
-    students = ['puttu001', 'arya002', 'rohit003', 'priya004']
+    students = [sid for sid in ['puttu001', 'arya002', 'rohit003', 'priya004']
+                if sid in owned]
     for i in range(30):
         date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
         for student_id in students:
@@ -167,6 +355,17 @@ def init_database():
     conn.close()
 
 
+@app.before_request
+def start_scheduler():
+    """Start the job scheduler with the first request.
+
+    WSGI servers never run the __main__ block, so this is what starts it
+    there; start() is a no-op once the scheduler is running.
+    """
+    if app.config['RUN_JOBS']:
+        scheduler.start()
+
+
 @app.route('/')
 def index():
     """Serve the main dashboard page."""
@@ -175,9 +374,11 @@ def index():
 
 @app.route('/api/students', methods=['GET'])
 def get_all_students():
-    """Get all students with their details."""
-    conn = get_db_connection()
-    students = conn.execute('''
+    """Get all students with their details, or only ?ids=a,b,c."""
+    ids = request.args.get('ids')
+    wanted = ids.split(',') if ids else []
+    where = f"WHERE s.id IN ({','.join('?' * len(wanted))})" if wanted else ''
+    per_shard = fan_out(lambda conn: conn.execute(f'''
         SELECT s.*, c.name as course_name,
                (SELECT AVG(score)
                 FROM assignments
@@ -190,16 +391,23 @@ def get_all_students():
                 WHERE student_id = s.id) as attendance_percentage
         FROM students s
         LEFT JOIN courses c ON s.course_id = c.id
-    ''').fetchall()
-    result = [dict(student) for student in students]
-    conn.close()
+        {where}
+    ''', wanted).fetchall())
+    result = [
+        dict(student, campus=shard)
+        for shard, students in per_shard.items()
+        for student in students
+    ]
     return jsonify(result)
 
 
 @app.route('/api/student/<student_id>', methods=['GET'])
 def get_student(student_id):
     """Get detailed information for a specific student."""
-    conn = get_db_connection()
+    shard = find_student_shard(student_id)
+    if shard is None:
+        return jsonify({"error": "Student not found"}), 404
+    conn = get_db_connection(shard)
     student = conn.execute('''
         SELECT s.*, c.name as course_name
         FROM students s
@@ -224,98 +432,189 @@ def get_student(student_id):
         (student_id,)
     ).fetchall()
     conn.close()
-    return jsonify({
+    response = jsonify({
         "student": dict(student),
         "assignments": [dict(a) for a in assignments],
         "semesters": [dict(s) for s in semesters],
         "attendance": [dict(a) for a in attendance]
     })
+    # Clients send this back as If-Match to update without losing changes
+    response.set_etag(str(student['version']))
+    return response
+
+
+# Columns a PUT may change; fields missing from the payload are left as-is
+UPDATABLE_STUDENT_FIELDS = ('name', 'email', 'phone', 'performance')
 
 
 @app.route('/api/student/<student_id>', methods=['PUT'])
 def update_student(student_id):
-    """Update student information."""
-    data = request.get_json()
-    conn = get_db_connection()
-    conn.execute(
-        'UPDATE students SET name = ?, email = ?, phone = ?, performance = ? WHERE id = ?',
-        (
-            data.get('name'),
-            data.get('email'),
-            data.get('phone'),
-            data.get('performance'),
-            student_id
+    """Update the provided student fields.
+
+    With an If-Match header carrying the ETag from GET, the update only
+    applies if nobody changed the student since (412 otherwise).
+    """
+    data = request.get_json() or {}
+    fields = [field for field in UPDATABLE_STUDENT_FIELDS if field in data]
+    if not fields:
+        return jsonify({"error": "No fields to update"}), 400
+    expected = None
+    if request.if_match and not request.if_match.star_tag:
+        expected = request.if_match.as_set()
+
+    def update(conn):
+        row = conn.execute(
+            'SELECT version FROM students WHERE id = ?', (student_id,)
+        ).fetchone()
+        if row is None:
+            return None, False
+        if expected is not None and str(row['version']) not in expected:
+            return row['version'], False
+        conn.execute(
+            f'UPDATE students SET {", ".join(f"{f} = ?" for f in fields)}, '
+            'version = version + 1 WHERE id = ?',
+            [data[field] for field in fields] + [student_id]
         )
-    )
-    conn.commit()
-    conn.close()
-    return jsonify({"message": "Student updated successfully"})
+        return row['version'] + 1, True
+
+    try:
+        version, updated = write_to_shard(owning_shard(student_id), update)
+    except sqlite3.IntegrityError as e:
+        return jsonify({"error": str(e)}), 400
+    except DatabaseBusy as e:
+        return jsonify({"error": str(e)}), 503
+    if version is None:
+        return jsonify({"error": "Student not found"}), 404
+    if not updated:
+        response = jsonify({
+            "error": "Student was modified by another request",
+            "version": version
+        })
+        response.status_code = 412
+    else:
+        response = jsonify({
+            "message": "Student updated successfully",
+            "version": version
+        })
+    response.set_etag(str(version))
+    return response
 
 
 @app.route('/api/assignments', methods=['POST'])
 def add_assignment():
     """Add a new assignment for a student."""
     data = request.get_json()
-    conn = get_db_connection()
-    conn.execute(
-        (
+    try:
+        write_to_shard(owning_shard(data['student_id']), lambda conn: conn.execute(
             (
                 'INSERT INTO assignments (student_id, subject, score, max_score, '
                 'assignment_date) VALUES (?, ?, ?, ?, ?)'
+            ),
+            (
+                data['student_id'],
+                data['subject'],
+                data['score'],
+                data.get('max_score', 100),
+                data.get('assignment_date', datetime.now().strftime('%Y-%m-%d'))
             )
-        ),
-        (
-            data['student_id'],
-            data['subject'],
-            data['score'],
-            data.get('max_score', 100),
-            data.get('assignment_date', datetime.now().strftime('%Y-%m-%d'))
-        )
-    )
-    conn.commit()
-    conn.close()
+        ))
+    except DatabaseBusy as e:
+        return jsonify({"error": str(e)}), 503
     return jsonify({"message": "Assignment added successfully"})
 
 
 @app.route('/api/analytics/overview', methods=['GET'])
 def get_analytics_overview():
-    """Get overall analytics for the dashboard."""
-    conn = get_db_connection()
-    # Overall statistics
-    total_students = (
-        conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]
-    )
-    avg_cgpa = conn.execute('SELECT AVG(cgpa) FROM semesters').fetchone()[0]
-    avg_score_query = 'SELECT AVG(score) FROM assignments'
-    avg_score_row = conn.execute(avg_score_query).fetchone()
-    avg_attendance = avg_score_row[0]
+    """Get overall analytics for the dashboard.
+
+    Served from the last analytics_overview job. If the data changed since
+    that job ran, a refresh is queued and the previous result is served
+    meanwhile; it is only computed here before any job has finished.
+    """
+    if not app.config['RUN_JOBS']:
+        return jsonify(compute_analytics_overview())
+    job = scheduler.last_result('analytics_overview')
+    if job is None or 'overview' not in job['result']:
+        scheduler.enqueue_once('analytics_overview')
+        return jsonify(compute_analytics_overview())
+    if job['result']['versions'] != fan_out(current_seq):
+        scheduler.enqueue_once('analytics_overview')
+    return jsonify(job['result']['overview'])
+
+
+def compute_analytics_overview():
+    """Merge the per-shard analytics pieces into the overview payload."""
+    per_shard = fan_out(analytics_partials)
+    # Overall statistics: averages are merged from per-shard sums and counts
+    total_students = sum(p['total_students'] for p in per_shard.values())
+    cgpa_sum = sum(p['cgpa_sum'] or 0 for p in per_shard.values())
+    cgpa_count = sum(p['cgpa_count'] for p in per_shard.values())
+    score_sum = sum(p['score_sum'] or 0 for p in per_shard.values())
+    score_count = sum(p['score_count'] for p in per_shard.values())
+    avg_cgpa = cgpa_sum / cgpa_count if cgpa_count else None
+    avg_attendance = score_sum / score_count if score_count else None
     # Course distribution
+    course_counts = {}
+    for partial in per_shard.values():
+        for course in partial['course_distribution']:
+            course_counts[course['name']] = (
+                course_counts.get(course['name'], 0) + course['student_count']
+            )
+    course_dist = [
+        {"name": name, "student_count": count}
+        for name, count in sorted(course_counts.items())
+    ]
+    # Recent activity
+    recent_assignments = sorted(
+        (a for p in per_shard.values() for a in p['recent_activity']),
+        key=lambda a: a['assignment_date'] or '',
+        reverse=True
+    )[:5]
+    return {
+        "overview": {
+            "total_students": total_students,
+            "average_cgpa": round(avg_cgpa, 2) if avg_cgpa else 0,
+            "average_score": round(avg_attendance, 2) if avg_attendance else 0
+        },
+        "course_distribution": course_dist,
+        "recent_activity": recent_assignments
+    }
+
+
+def analytics_partials(conn):
+    """Compute the mergeable pieces of the analytics overview for one shard."""
+    cgpa = conn.execute('SELECT SUM(cgpa), COUNT(cgpa) FROM semesters').fetchone()
+    score = conn.execute(
+        'SELECT SUM(score), COUNT(score) FROM assignments'
+    ).fetchone()
     course_dist = conn.execute('''
         SELECT c.name, COUNT(s.id) as student_count
         FROM courses c
         LEFT JOIN students s ON c.id = s.course_id
         GROUP BY c.name
     ''').fetchall()
-    # Recent activity
+    # CROSS JOIN keeps assignments as the outer loop, so SQLite walks the
+    # date index backwards and stops after 5 rows instead of sorting them all
     recent_assignments = conn.execute('''
         SELECT a.*, s.name as student_name
         FROM assignments a
-        JOIN students s ON a.student_id = s.id
+        CROSS JOIN students s ON a.student_id = s.id
         ORDER BY a.assignment_date DESC
         LIMIT 5
     ''').fetchall()
-    conn.close()
-    return jsonify({
-        "overview": {
-            "total_students": total_students,
-            "average_cgpa": round(avg_cgpa, 2) if avg_cgpa else 0,
-            "average_score": round(avg_attendance, 2) if avg_attendance else 0
-        },
+    return {
+        "total_students": (
+            conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]
+        ),
+        "cgpa_sum": cgpa[0],
+        "cgpa_count": cgpa[1],
+        "score_sum": score[0],
+        "score_count": score[1],
         "course_distribution": [dict(course) for course in course_dist],
         "recent_activity": [
             dict(assignment) for assignment in recent_assignments
         ]
-    })
+    }
 
 # ===== ADD THESE NEW ENDPOINTS =====
 # ===== ADD THESE ENDPOINTS FOR BUTTON FUNCTIONALITY =====
@@ -324,25 +623,31 @@ def get_analytics_overview():
 @app.route('/api/student', methods=['POST'])
 def add_student():
     """Add a new student."""
-    data = request.get_json()
+    data = request.get_json(silent=True)
     print("Adding student:", data)  # Debug log
     
-    conn = get_db_connection()
+    if not isinstance(data, dict) or 'id' not in data or 'name' not in data:
+        return jsonify({"error": "A JSON object with id and name is required"}), 400
     try:
-        conn.execute(
-            '''INSERT INTO students (id, name, email, phone, course_id, performance)
-               VALUES (?, ?, ?, ?, ?, ?)''',
-            (data['id'], data['name'], data.get('email'), data.get('phone'),
-             data.get('course_id', 1), data.get('performance', 'Good'))
-        )
-        conn.commit()
+        campus = data.get('campus')
+        if campus not in app.config['SHARDS']:
+            campus = shard_for_course(data.get('course_id', 1))
+        with student_ids_lock:
+            if find_student_shard(data['id']) is not None:
+                return jsonify({"error": "Student ID already exists"}), 400
+            write_to_shard(campus, lambda conn: conn.execute(
+                '''INSERT INTO students (id, name, email, phone, course_id, performance)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (data['id'], data['name'], data.get('email'), data.get('phone'),
+                 data.get('course_id', 1), data.get('performance', 'Good'))
+            ))
         return jsonify({"message": "Student added successfully"})
-    # except sqlite3.IntegrityError as e:
-    #     return jsonify({"error": "Student ID already exists"}), 400
+    except sqlite3.IntegrityError:
+        return jsonify({"error": "Student ID already exists"}), 400
+    except DatabaseBusy as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
 
 @app.route('/api/student/<student_id>', methods=['DELETE'])
@@ -350,15 +655,15 @@ def delete_student(student_id):
     """Delete a student."""
     print("Deleting student:", student_id)  # Debug log
     
-    conn = get_db_connection()
     try:
-        conn.execute('DELETE FROM students WHERE id = ?', (student_id,))
-        conn.commit()
+        write_to_shard(owning_shard(student_id), lambda conn: conn.execute(
+            'DELETE FROM students WHERE id = ?', (student_id,)
+        ))
         return jsonify({"message": "Student deleted successfully"})
+    except DatabaseBusy as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close() 
 
 
 # @app.route('/api/assignments', methods=['POST'])
@@ -389,18 +694,16 @@ def mark_attendance(student_id):
     data = request.get_json()
     print("Marking attendance:", student_id, data)  # Debug log
     
-    conn = get_db_connection()
     try:
-        conn.execute(
+        write_to_shard(owning_shard(student_id), lambda conn: conn.execute(
             'INSERT INTO attendance (student_id, date, present) VALUES (?, ?, ?)',
             (student_id, data.get('date', datetime.now().strftime('%Y-%m-%d')), data.get('present', True))
-        )
-        conn.commit()
+        ))
         return jsonify({"message": "Attendance marked successfully"})
+    except DatabaseBusy as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
 
 @app.route('/api/search/students', methods=['GET'])
@@ -408,26 +711,27 @@ def search_students():
     """Search students by name or ID."""
     query = request.args.get('q', '')
     
-    conn = get_db_connection()
     try:
-        students = conn.execute('''
+        per_shard = fan_out(lambda conn: conn.execute('''
             SELECT s.*, c.name as course_name 
             FROM students s 
             LEFT JOIN courses c ON s.course_id = c.id 
             WHERE s.name LIKE ? OR s.id LIKE ?
-        ''', (f'%{query}%', f'%{query}%')).fetchall()
+        ''', (f'%{query}%', f'%{query}%')).fetchall())
         
-        result = [dict(student) for student in students]
+        result = [
+            dict(student, campus=shard)
+            for shard, students in per_shard.items()
+            for student in students
+        ]
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
 
 @app.route('/api/courses', methods=['GET'])
 def get_courses():
-    """Get all available courses."""
+    """Get all available courses (read from the default shard)."""
     conn = get_db_connection()
     try:
         courses = conn.execute('SELECT * FROM courses').fetchall()
@@ -439,11 +743,368 @@ def get_courses():
         conn.close()
 
 
+# ===== RECOMMENDATIONS =====
+
+
+# Seconds a refresh waits after a write, so a burst of writes shares one run
+RECOMMENDATIONS_REFRESH_DELAY = 2
+
+
+def refresh_recommendations_later():
+    """Queue a recommendations refresh unless one is already waiting."""
+    if not app.config['RUN_JOBS']:
+        return
+    try:
+        scheduler.enqueue_once('recommendations', delay=RECOMMENDATIONS_REFRESH_DELAY)
+    except sqlite3.OperationalError as e:
+        # The write itself succeeded; a stale read will queue the refresh
+        print(f"Could not queue recommendations refresh: {e}")
+
+
+def shard_recommendations(shard, serve_stale=False):
+    """Recommendations for one shard, cached until its data changes.
+
+    With `serve_stale` (and jobs running in this process), an outdated
+    result is served while the recommendations job refreshes it.
+    """
+    conn = get_db_connection(shard)
+    try:
+        return cached_recommendations(
+            app.config['SHARDS'][shard], conn,
+            on_stale=refresh_recommendations_later
+            if serve_stale and app.config['RUN_JOBS'] else None
+        )
+    finally:
+        conn.close()
+
+
+@app.route('/api/student/<student_id>/recommendations', methods=['GET'])
+def get_student_recommendations(student_id):
+    """Get personalized recommendations for a specific student."""
+    shard = find_student_shard(student_id)
+    recommendation = None
+    if shard:
+        conn = get_db_connection(shard)
+        try:
+            recommendation = student_recommendation(
+                app.config['SHARDS'][shard], conn, student_id
+            )
+        finally:
+            conn.close()
+    if not recommendation:
+        return jsonify({"error": "Student not found"}), 404
+    return jsonify(recommendation)
+
+
+@app.route('/api/recommendations', methods=['GET'])
+def get_recommendations():
+    """Get recommendations for all students, or only ?ids=a,b,c."""
+    ids = request.args.get('ids')
+    wanted = set(ids.split(',')) if ids else None
+    shards = list(app.config['SHARDS'])
+    result = [
+        recommendation
+        for recommendations in shard_pool.map(
+            lambda shard: shard_recommendations(shard, serve_stale=True), shards
+        )
+        for student_id, recommendation in recommendations.items()
+        if wanted is None or student_id in wanted
+    ]
+    return jsonify(result)
+
+
+# ===== INCREMENTAL SYNC =====
+
+
+def parse_cursor(since):
+    """Parse a sync cursor like 'main:12,north:5' into {shard: seq}.
+
+    A bare number applies to every shard. A shard in the middle of a reset
+    has a position 'seq/table/rowid' instead, parsed to a tuple.
+    """
+    cursor = {}
+    for part in filter(None, since.split(',')):
+        if ':' in part:
+            shard, seq = part.rsplit(':', 1)
+            if '/' in seq:
+                seq, table, rowid = seq.split('/')
+                if table not in CHANGE_TRACKED_TABLES:
+                    raise ValueError(f"Unknown table: {table}")
+                cursor[shard] = (int(seq), table, int(rowid))
+            else:
+                cursor[shard] = int(seq)
+        else:
+            cursor.update((shard, int(part)) for shard in app.config['SHARDS'])
+    return cursor
+
+
+def format_cursor(cursor):
+    """Inverse of parse_cursor."""
+    return ','.join(
+        f'{shard}:{"/".join(map(str, seq)) if isinstance(seq, tuple) else seq}'
+        for shard, seq in cursor.items()
+    )
+
+
+def reset_page(conn, shard, position, limit):
+    """One page of a shard's full contents, in table then rowid order.
+
+    `position` is (seq, table, rowid): the seq the reset started at and the
+    last row already sent. Returns (changes, next position or None when
+    every table has been sent).
+    """
+    seq, table, after = position
+    changes = []
+    tables = CHANGE_TRACKED_TABLES[CHANGE_TRACKED_TABLES.index(table):]
+    for table in tables:
+        rows = conn.execute(
+            f'SELECT rowid, * FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?',
+            (after, limit - len(changes))
+        ).fetchall()
+        for row in rows:
+            values = dict(zip(row.keys()[1:], tuple(row)[1:]))
+            changes.append({"campus": shard, "table": table, "op": "upsert",
+                            "key": str(values['id']), "row": values})
+        if len(changes) == limit:
+            return changes, (seq, table, rows[-1][0])
+        after = 0
+    return changes, None
+
+
+def shard_changes(shard, since, limit):
+    """Compacted changes for one shard since a seq.
+
+    Each changed row appears once with its current state, or as a delete if
+    it no longer exists. If the log cannot serve `since` (pruned, or the
+    shard was re-initialized) every row is sent instead, `limit` rows per
+    page, and `reset` is set on the first page. Once the last page is sent
+    the cursor returns to the seq the reset started at, so changes made
+    while paging are delivered as ordinary deltas.
+    """
+    conn = get_db_connection(shard)
+    try:
+        # One read transaction so the log and the rows agree
+        conn.execute('BEGIN')
+        floor = conn.execute('SELECT floor FROM change_log').fetchone()[0]
+        head = current_seq(conn)
+        position = since if isinstance(since, tuple) else None
+        if position:
+            since = position[0]
+        reset = since < floor or since > head
+        if reset:
+            # Start (or restart, if the log moved past a paged reset) from
+            # the first row of the first table
+            position = (head, CHANGE_TRACKED_TABLES[0], 0)
+        if position:
+            changes, upper = reset_page(conn, shard, position, limit)
+            if upper is None:
+                upper = position[0]
+                more = head > upper
+            else:
+                more = True
+            conn.commit()
+            return {"seq": upper, "more": more, "reset": reset, "changes": changes}
+
+        upper, more = head, False
+        boundary = conn.execute(
+            'SELECT seq FROM changes WHERE seq > ? ORDER BY seq '
+            'LIMIT 1 OFFSET ?',
+            (since, limit - 1)
+        ).fetchone()
+        if boundary:
+            upper = boundary[0]
+            more = conn.execute(
+                'SELECT 1 FROM changes WHERE seq > ? LIMIT 1', (upper,)
+            ).fetchone() is not None
+        keys = {}
+        for row in conn.execute(
+            'SELECT DISTINCT table_name, row_key FROM changes '
+            'WHERE seq > ? AND seq <= ?',
+            (since, upper)
+        ):
+            keys.setdefault(row['table_name'], []).append(row['row_key'])
+
+        changes = []
+        for table, table_keys in keys.items():
+            rows = []
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(table_keys), 500):
+                chunk = table_keys[i:i + 500]
+                rows += conn.execute(
+                    f'SELECT * FROM {table} WHERE id IN '
+                    f'({",".join("?" * len(chunk))})',
+                    chunk
+                ).fetchall()
+            found = set()
+            for row in rows:
+                found.add(str(row['id']))
+                changes.append({"campus": shard, "table": table, "op": "upsert",
+                                "key": str(row['id']), "row": dict(row)})
+            for key in table_keys:
+                if key not in found:
+                    changes.append({"campus": shard, "table": table,
+                                    "op": "delete", "key": key})
+        conn.commit()
+        return {"seq": upper, "more": more, "reset": reset, "changes": changes}
+    finally:
+        conn.close()
+
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Get compacted changes since the cursor returned by a previous call.
+
+    Pass ?since=latest to get the current cursor without any changes.
+    """
+    since = request.args.get('since', '')
+    shards = list(app.config['SHARDS'])
+    if since == 'latest':
+        heads = fan_out(current_seq)
+        return jsonify({"since": format_cursor(heads), "more": False,
+                        "reset": [], "changes": []})
+    try:
+        cursor = parse_cursor(since)
+    except ValueError:
+        return jsonify({"error": f"Invalid cursor: {since}"}), 400
+    limit = max(request.args.get('limit', 5000, type=int), 1)
+    results = dict(zip(shards, shard_pool.map(
+        lambda shard: shard_changes(shard, cursor.get(shard, 0), limit), shards
+    )))
+    return jsonify({
+        "since": format_cursor(
+            {shard: result["seq"] for shard, result in results.items()}
+        ),
+        "more": any(result["more"] for result in results.values()),
+        "reset": [shard for shard, result in results.items() if result["reset"]],
+        "changes": [
+            change for result in results.values() for change in result["changes"]
+        ]
+    })
+
+
+# ===== BACKGROUND JOBS =====
+
+
+@scheduler.register('analytics_overview')
+def analytics_overview_job(payload):
+    """Recompute the analytics overview across all shards.
+
+    The change-log heads are read first, so a write that lands during the
+    computation makes the result look outdated rather than current.
+    """
+    versions = fan_out(current_seq)
+    return {"versions": versions, "overview": compute_analytics_overview()}
+
+
+@scheduler.register('recommendations')
+def recommendations_job(payload):
+    """Warm the recommendations cache on every shard."""
+    shards = list(app.config['SHARDS'])
+    counts = shard_pool.map(
+        lambda shard: len(shard_recommendations(shard)), shards
+    )
+    return dict(zip(shards, counts))
+
+
+@scheduler.register('optimize')
+def optimize_job(payload):
+    """Refresh planner statistics (and optionally VACUUM) on every shard."""
+    def optimize(conn):
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+        if payload.get('vacuum'):
+            conn.execute('VACUUM')
+        return True
+    return {"shards": sorted(fan_out(optimize))}
+
+
+@scheduler.register('prune_changes')
+def prune_changes_job(payload):
+    """Drop change log entries older than payload['days'] (default 7).
+
+    Clients with a cursor older than the pruned range get a full reset.
+    """
+    days = payload.get('days', 7)
+
+    def prune(conn):
+        pruned = conn.execute(
+            "SELECT MAX(seq) FROM changes WHERE changed_at < datetime('now', ?)",
+            (f'-{days} days',)
+        ).fetchone()[0]
+        if pruned is None:
+            return 0
+        deleted = conn.execute(
+            'DELETE FROM changes WHERE seq <= ?', (pruned,)
+        ).rowcount
+        conn.execute(
+            'UPDATE change_log SET floor = MAX(floor, ?) WHERE id = 1', (pruned,)
+        )
+        conn.commit()
+        return deleted
+    return fan_out(prune)
+
+
+# Heavy maintenance runs nightly, between 2 and 5 AM local time
+scheduler.schedule('optimize', every=24 * 60 * 60, hours=(2, 5))
+scheduler.schedule('prune_changes', every=24 * 60 * 60, hours=(2, 5))
+
+
+@app.route('/api/jobs', methods=['POST'])
+def enqueue_job():
+    """Queue a background job; poll /api/jobs/<id> for its status."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    payload = data.get('payload', {})
+    delay = data.get('delay', 0)
+    max_attempts = data.get('max_attempts', 3)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "payload must be an object"}), 400
+    # bool is an int subclass, but true/false are not meaningful here
+    if isinstance(delay, bool) or not isinstance(delay, (int, float)) or not delay >= 0:
+        return jsonify({"error": "delay must be a non-negative number"}), 400
+    if isinstance(max_attempts, bool) or not isinstance(max_attempts, int) \
+            or max_attempts < 1:
+        return jsonify({"error": "max_attempts must be an integer >= 1"}), 400
+    try:
+        job_id = scheduler.enqueue(
+            data.get('name'), payload, delay=delay, max_attempts=max_attempts
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"id": job_id, "status": "queued"}), 202
+
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List recent background jobs, optionally filtered by ?status=."""
+    return jsonify(scheduler.list(
+        request.args.get('status'),
+        request.args.get('limit', 50, type=int)
+    ))
+
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status (and result, once done) of a background job."""
+    job = scheduler.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
 if __name__ == '__main__':
     # Initialize database on first run
     init_database()
+    debug = True
+    # With debug on, the reloader runs this block in a watcher process and
+    # again in the child that serves requests (WERKZEUG_RUN_MAIN); only the
+    # serving process runs jobs. Start now so scheduled jobs do not wait for
+    # the first request.
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        scheduler.start()
     print("Database initialized with sample data!")
     print("Starting Student Dashboard API...")
     print("Web Interface: http://localhost:5000")
     print("API Base URL: http://localhost:5000/api/students")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000, debug=debug)
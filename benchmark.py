@@ -0,0 +1,337 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import app as backend
+
+BASELINE_PATH = 'benchmark_baseline.json'
+SUBJECTS = ['Math', 'ML', 'Python', 'DBMS', 'CN', 'Java', 'OS', 'Web Tech',
+            'Algorithms', 'Statistics']
+PERFORMANCE = ['Excellent', 'Very Good', 'Good', 'Average']
+
+# Tiny bookkeeping tables that are always read in full
+ALWAYS_SCANNED = {'sqlite_sequence', 'change_log'}
+# Recommendations aggregate the whole shard in one pass: the base tables and
+# the window-function CTEs are read in full, but every join must be keyed
+RECOMMENDATION_SCANS = {'s', 'assignments', 'attendance', 'semesters',
+                        'subject_avg', 'ranked'}
+# A stale cache makes the per-student route compute that student alone:
+# base tables are searched by student_id and only the tiny CTEs are scanned
+STUDENT_RECOMMENDATION_SCANS = {'subject_avg', 'ranked', 'w', 'cgpa_trend'}
+
+# Requests covering every API route, in order. Each entry is
+# (method, path, json body, tables/aliases the route may SCAN in full,
+#  {context key: response key} to remember for later paths).
+# Paths are formatted with the context ({sid}, {cursor}, {job_id}).
+ROUTES = [
+    ('GET', '/api/changes?since=latest', None, set(), {'cursor': 'since'}),
+    ('GET', '/api/students', None, {'s'}, {}),
+    ('GET', '/api/students?ids={sid}', None, set(), {}),
+    ('GET', '/api/student/{sid}', None, set(), {}),
+    ('PUT', '/api/student/{sid}', {'phone': '555-0100'}, set(), {}),
+    ('POST', '/api/assignments',
+     {'student_id': '{sid}', 'subject': 'Math', 'score': 70}, set(), {}),
+    ('POST', '/api/student/{sid}/attendance', {'present': True}, set(), {}),
+    ('POST', '/api/student',
+     {'id': 'bench-new', 'name': 'Bench', 'course_id': 1}, set(), {}),
+    ('DELETE', '/api/student/bench-new', None, set(), {}),
+    # Whole-table aggregates over the small courses table ('c'); recent
+    # activity must walk the date index backwards under its LIMIT
+    ('GET', '/api/analytics/overview', None,
+     {'students', 'semesters', 'assignments', 'c'}, {}),
+    # A leading-wildcard LIKE cannot use an index
+    ('GET', '/api/search/students?q=Student 12', None, {'s'}, {}),
+    ('GET', '/api/courses', None, {'courses'}, {}),
+    ('GET', '/api/student/{sid}/recommendations', None,
+     STUDENT_RECOMMENDATION_SCANS, {}),
+    ('GET', '/api/recommendations?ids={sid}', None, RECOMMENDATION_SCANS, {}),
+    ('GET', '/api/changes?since={cursor}', None, set(), {}),
+    # An expired cursor: the full reset is paged by rowid
+    ('GET', '/api/changes?since=0&limit=100', None, set(), {}),
+    ('POST', '/api/jobs', {'name': 'analytics_overview'}, set(), {'job_id': 'id'}),
+    ('GET', '/api/jobs', None, {'jobs'}, {}),
+    ('GET', '/api/jobs/{job_id}', None, set(), {})
+]
+
+# Routes that run no SQL
+UNBENCHMARKED_ENDPOINTS = {'static', 'index'}
+
+
+def seed(path, students, attendance_per_student):
+    """
+    Create a database with the app's schema and `students` synthetic
+    students, each with assignments, semesters and attendance spread over
+    the last three years
+    """
+    backend.app.config['SHARDS'] = {'main': path}
+    backend.app.config['RUN_JOBS'] = False
+    with contextlib.redirect_stdout(io.StringIO()):
+        backend.init_database()
+    rng = random.Random(students)
+    today = date.today()
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO students (id, name, email, phone, course_id, performance) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        (
+            (f'S{i:07d}', f'Student {i}', f's{i}@example.com', None,
+             rng.choice((1, 2)), rng.choice(PERFORMANCE))
+            for i in range(students)
+        )
+    )
+    conn.executemany(
+        'INSERT INTO assignments (student_id, subject, score, max_score, '
+        'assignment_date) VALUES (?, ?, ?, 100, ?)',
+        (
+            (f'S{i:07d}', subject, rng.randint(40, 100),
+             (today - timedelta(days=rng.randrange(3 * 365))).isoformat())
+            for i in range(students)
+            for subject in rng.sample(SUBJECTS, 5)
+        )
+    )
+    conn.executemany(
+        'INSERT INTO semesters (student_id, semester, cgpa) VALUES (?, ?, ?)',
+        (
+            (f'S{i:07d}', semester, round(rng.uniform(6.0, 10.0), 2))
+            for i in range(students)
+            for semester in range(1, rng.randint(2, 8))
+        )
+    )
+    conn.executemany(
+        'INSERT INTO attendance (student_id, date, present) VALUES (?, ?, ?)',
+        (
+            (f'S{i:07d}', (today - timedelta(days=day)).isoformat(),
+             rng.random() > 0.2)
+            for i in range(students)
+            for day in rng.sample(range(3 * 365), attendance_per_student)
+        )
+    )
+    conn.commit()
+    # Match production, where the nightly optimize job keeps statistics fresh
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def normalize(sql):
+    """Replace literals and collapse whitespace so statements compare across runs"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return ' '.join(sql.split())
+
+
+def capture_statements():
+    """
+    Call every route once and return {route label: [sql, ...]} with the
+    SQL each one executed (literals inlined by SQLite's trace hook)
+    """
+    captured = {}
+    current = []
+    backend.app.config['SQL_TRACE'] = lambda sql: current.append(sql)
+    client = backend.app.test_client()
+    context = {'sid': 'S0000012'}
+    try:
+        for method, path, body, _, save in ROUTES:
+            label = f'{method} {path}'
+            url = path.format(**context)
+            if body is not None:
+                body = {k: v.format(**context) if isinstance(v, str) else v
+                        for k, v in body.items()}
+            current.clear()
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = client.open(url, method=method, json=body)
+            if response.status_code >= 400:
+                raise RuntimeError(
+                    f'{label} returned {response.status_code}: {response.get_data(as_text=True)}'
+                )
+            for key, response_key in save.items():
+                context[key] = response.get_json()[response_key]
+            statements = []
+            for sql in current:
+                keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+                if keyword in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE') \
+                        and sql not in statements:
+                    statements.append(sql)
+            captured[label] = statements
+    finally:
+        backend.app.config['SQL_TRACE'] = None
+    return captured
+
+
+def check_coverage():
+    """Return the API endpoints that no ROUTES entry exercises"""
+    adapter = backend.app.url_map.bind('localhost')
+    covered = set()
+    for method, path, _, _, _ in ROUTES:
+        url = path.format(sid='x', cursor='0', job_id=1).split('?')[0]
+        covered.add((adapter.match(url, method=method)[0], method))
+    missing = []
+    for rule in backend.app.url_map.iter_rules():
+        if rule.endpoint in UNBENCHMARKED_ENDPOINTS:
+            continue
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            if (rule.endpoint, method) not in covered:
+                missing.append(f'{method} {rule.rule}')
+    return missing
+
+
+def query_plan(conn, sql):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+
+
+def plan_problems(sql, plan, allowed):
+    """
+    Return the plan lines that read a table in full when the route may not,
+    or that sort every row just to return the first few. Walking an index
+    (SCAN ... USING INDEX) only counts as cheap when a LIMIT stops it early;
+    otherwise it still visits the whole table.
+    """
+    limited = re.search(r'\bLIMIT\b', sql, re.IGNORECASE) is not None
+    problems = []
+    for line in plan:
+        match = re.match(r'SCAN (\w+)( USING (?:COVERING )?INDEX)?', line)
+        if match:
+            if match.group(1) in allowed | ALWAYS_SCANNED or match.group(1) == 'CONSTANT':
+                continue
+            if match.group(2) and limited:
+                continue
+            problems.append(line)
+        elif limited and line.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            problems.append(line)
+    return problems
+
+
+def time_statement(conn, sql, repeat):
+    """Median wall time in ms; writes are rolled back after each run"""
+    timings = []
+    for _ in range(repeat):
+        conn.execute('BEGIN')
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+        conn.execute('ROLLBACK')
+    return statistics.median(timings)
+
+
+def run_scale(directory, students, attendance_per_student, repeat):
+    """Seed one database and benchmark every route statement against it"""
+    path = os.path.join(directory, f'bench_{students}.db')
+    start = time.perf_counter()
+    seed(path, students, attendance_per_student)
+    print(f"\n===== {students} students "
+          f"(seeded in {time.perf_counter() - start:.1f}s) =====")
+
+    captured = capture_statements()
+    allowed = {f'{method} {path}': scans for method, path, _, scans, _ in ROUTES}
+    conn = sqlite3.connect(path, isolation_level=None)
+    results = {}
+    for label, statements in captured.items():
+        for sql in statements:
+            plan = query_plan(conn, sql)
+            try:
+                median_ms = time_statement(conn, sql, repeat)
+            except sqlite3.Error as e:
+                median_ms = None
+                print(f"  ! could not time {normalize(sql)[:60]}: {e}")
+            results.setdefault(label, {})[normalize(sql)] = {
+                "median_ms": median_ms,
+                "plan": plan,
+                "plan_problems": plan_problems(sql, plan, allowed[label])
+            }
+    conn.close()
+    return results
+
+
+def compare(scale, results, baseline, tolerance, min_delta_ms):
+    """Print a report for one scale and return its failures"""
+    failures = []
+    for label, statements in results.items():
+        print(f"\n{label}")
+        for sql, result in statements.items():
+            base = baseline.get(str(scale), {}).get(label, {}).get(sql)
+            median_ms = result["median_ms"]
+            status = ''
+            if result["plan_problems"]:
+                status = 'BAD PLAN'
+                failures.append(
+                    f"[{scale}] {label}: {'; '.join(result['plan_problems'])} in {sql[:80]}"
+                )
+            elif base and median_ms is not None and base["median_ms"] is not None \
+                    and median_ms > base["median_ms"] * tolerance \
+                    and median_ms - base["median_ms"] > min_delta_ms:
+                status = f'REGRESSED (baseline {base["median_ms"]:.2f} ms)'
+                failures.append(
+                    f"[{scale}] {label}: {median_ms:.2f} ms vs baseline "
+                    f"{base['median_ms']:.2f} ms in {sql[:80]}"
+                )
+            elif base and base["plan"] != result["plan"]:
+                status = 'plan changed'
+            timing = f'{median_ms:9.2f} ms' if median_ms is not None else '        n/a'
+            print(f"  {timing}  {sql[:90]} {status}")
+            for line in result["plan"]:
+                print(f"               | {line}")
+    return failures
+
+
+def main():
+    """Run the query-plan regression benchmark from the command line"""
+    parser = argparse.ArgumentParser(
+        description="Benchmark every SQL statement used by the API routes "
+                    "and fail on full table scans or latency regressions"
+    )
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="numbers of students to seed (default: 1000 10000 100000)")
+    parser.add_argument('--attendance', type=int, default=20,
+                        help="attendance records per student, spread over three years")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per statement")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="store this run's timings and plans as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=2.0,
+                        help="fail when a statement is this many times slower than baseline")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help="ignore slowdowns smaller than this many ms")
+    args = parser.parse_args()
+
+    missing = check_coverage()
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    elif not args.update_baseline:
+        print(f"⚠️  No baseline at {args.baseline}; only checking query plans")
+
+    failures = [f"no benchmark covers {route}" for route in missing]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scales:
+            results[str(scale)] = run_scale(directory, scale, args.attendance, args.repeat)
+            failures += compare(scale, results[str(scale)], baseline,
+                                args.tolerance, args.min_delta_ms)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+
+    print()
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ All statements use indexed plans and are within baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+# Tables whose writes are recorded in the change log
+CHANGE_TRACKED_TABLES = ('students', 'courses', 'assignments', 'semesters',
+                         'attendance')
+
+
+def current_seq(conn):
+    """
+    Return the last change log seq issued on a shard (0 if none).
+    It is both the sync cursor and the version of the shard's data.
+    """
+    row = conn.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = 'changes'"
+    ).fetchone()
+    return row[0] if row else 0
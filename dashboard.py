@@ -1,14 +1,58 @@
 # frontend/dashboard.py
+import argparse
+import sqlite3
 import requests
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 import numpy as np
 from matplotlib.gridspec import GridSpec
+from snapshot import load_snapshot, decode
 
 # API configuration
 API_BASE_URL = "http://localhost:5000/api"
 
+# Local copy of the backend tables, kept current with /api/changes
+CACHE_PATH = "dashboard_cache.db"
+
+# The backend tables merged across campuses, plus the sync cursor
+CACHE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS students (
+        campus TEXT NOT NULL, id TEXT NOT NULL, name TEXT, email TEXT,
+        phone TEXT, course_id INTEGER, performance TEXT, created_at TEXT,
+        version INTEGER,
+        PRIMARY KEY (campus, id)
+    );
+    CREATE TABLE IF NOT EXISTS courses (
+        campus TEXT NOT NULL, id INTEGER NOT NULL, name TEXT, department TEXT,
+        PRIMARY KEY (campus, id)
+    );
+    CREATE TABLE IF NOT EXISTS assignments (
+        campus TEXT NOT NULL, id INTEGER NOT NULL, student_id TEXT,
+        subject TEXT, score REAL, max_score REAL, assignment_date TEXT,
+        PRIMARY KEY (campus, id)
+    );
+    CREATE TABLE IF NOT EXISTS semesters (
+        campus TEXT NOT NULL, id INTEGER NOT NULL, student_id TEXT,
+        semester INTEGER, cgpa REAL,
+        PRIMARY KEY (campus, id)
+    );
+    CREATE TABLE IF NOT EXISTS attendance (
+        campus TEXT NOT NULL, id INTEGER NOT NULL, student_id TEXT,
+        date TEXT, present INTEGER,
+        PRIMARY KEY (campus, id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_assignments_student
+        ON assignments (campus, student_id, score);
+    CREATE INDEX IF NOT EXISTS idx_attendance_student
+        ON attendance (campus, student_id, present);
+    CREATE TABLE IF NOT EXISTS sync_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        since TEXT NOT NULL
+    );
+    INSERT OR IGNORE INTO sync_state (id, since) VALUES (1, '');
+'''
+
 
 def fetch_student_data():
     """
@@ -26,6 +70,190 @@ def fetch_student_data():
         return None
 
 
+def open_cache(cache_path=CACHE_PATH):
+    """Open (creating if needed) the local SQLite cache"""
+    conn = sqlite3.connect(cache_path)
+    conn.row_factory = sqlite3.Row
+    # A lost last page after a crash is simply downloaded again
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(CACHE_SCHEMA)
+    return conn
+
+
+def apply_changes(conn, delta):
+    """
+    Apply one page of /api/changes and its cursor in a single transaction,
+    so an interrupted sync resumes from the last page that was saved
+    """
+    columns = {
+        table: [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+        for table in ('students', 'courses', 'assignments', 'semesters', 'attendance')
+    }
+    with conn:
+        # The server could not serve our cursor for these campuses and
+        # is sending their full contents instead, starting on this page;
+        # the following pages only add rows
+        for campus in delta["reset"]:
+            for table in columns:
+                conn.execute(f'DELETE FROM {table} WHERE campus = ?', (campus,))
+        # A page lists each row at most once, so upserts and deletes can be
+        # applied in bulk per table
+        upserts = {table: [] for table in columns}
+        deletes = {table: [] for table in columns}
+        for change in delta["changes"]:
+            table = change["table"]
+            if table not in columns:
+                continue
+            if change["op"] == "upsert":
+                row = dict(change["row"], campus=change["campus"])
+                upserts[table].append([row.get(column) for column in columns[table]])
+            else:
+                deletes[table].append((change["campus"], change["key"]))
+        for table in columns:
+            conn.executemany(
+                f'INSERT OR REPLACE INTO {table} ({", ".join(columns[table])}) '
+                f'VALUES ({", ".join("?" * len(columns[table]))})',
+                upserts[table]
+            )
+            conn.executemany(
+                f'DELETE FROM {table} WHERE campus = ? AND id = ?', deletes[table]
+            )
+        conn.execute('UPDATE sync_state SET since = ? WHERE id = 1', (delta["since"],))
+
+
+def sync_student_data(cache_path=CACHE_PATH):
+    """
+    Update the local cache with the changes since the last sync and
+    return student records in the same shape as /api/students
+    Falls back to the cached data if the API is unreachable
+    """
+    conn = open_cache(cache_path)
+    try:
+        changed = 0
+        while True:
+            since = conn.execute('SELECT since FROM sync_state').fetchone()[0]
+            response = requests.get(f"{API_BASE_URL}/changes", params={"since": since})
+            response.raise_for_status()
+            delta = response.json()
+            apply_changes(conn, delta)
+            changed += len(delta["changes"])
+            if not delta["more"]:
+                break
+        print(f"✅ Synced with API ({changed} changed rows)")
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Error syncing with API: {e}")
+        since = conn.execute('SELECT since FROM sync_state').fetchone()[0]
+        if since == '':
+            print("⚠️  Please make sure the backend server is running!")
+            conn.close()
+            return None
+        print("⚠️  Using cached data from the last successful sync")
+        # A 'seq/table/rowid' cursor means a full reset stopped midway
+        if '/' in since:
+            print("⚠️  The cache is partway through a full download and incomplete")
+
+    try:
+        return students_from_cache(conn)
+    finally:
+        conn.close()
+
+
+def students_from_cache(conn):
+    """
+    Rebuild the /api/students records (course name, average score and
+    attendance percentage) from the cached tables
+    """
+    return [dict(row) for row in conn.execute('''
+        SELECT s.*, c.name AS course_name, a.avg_score,
+               p.present * 100.0 / p.total AS attendance_percentage
+        FROM students s
+        LEFT JOIN courses c ON c.campus = s.campus AND c.id = s.course_id
+        LEFT JOIN (
+            SELECT campus, student_id, AVG(score) AS avg_score
+            FROM assignments
+            GROUP BY campus, student_id
+        ) a ON a.campus = s.campus AND a.student_id = s.id
+        LEFT JOIN (
+            SELECT campus, student_id, SUM(present = 1) AS present,
+                   COUNT(*) AS total
+            FROM attendance
+            GROUP BY campus, student_id
+        ) p ON p.campus = s.campus AND p.student_id = s.id
+    ''')]
+
+
+def per_student_mean(codes, values, n):
+    """
+    Mean of values per student code (NaN for students without rows).
+    Rows whose student_id or value was NULL are left out, as AVG() does
+    """
+    codes = np.asarray(codes)
+    values = np.asarray(values, dtype=np.float64)
+    known = (codes >= 0) & ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (
+            np.bincount(codes[known], weights=values[known], minlength=n)
+            / np.bincount(codes[known], minlength=n)
+        )
+
+
+def load_snapshot_data(directory):
+    """
+    Build the same student records as /api/students from a snapshot
+    written by snapshot.py, without a running server or database
+    """
+    snapshot = load_snapshot(directory)
+    tables = snapshot["tables"]
+    dictionaries = snapshot["dictionaries"]
+    students = tables["students"]
+    assignments = tables["assignments"]
+    attendance = tables["attendance"]
+    n = len(dictionaries["student_id"])
+
+    # Per-student aggregates in one vectorized pass over the mapped columns
+    avg_score = per_student_mean(assignments["student_id"], assignments["score"], n)
+    attendance_pct = per_student_mean(attendance["student_id"], attendance["present"], n) * 100.0
+
+    codes = np.asarray(students["id"])
+    columns = {
+        column: decode(students[column], dictionaries[f"students.{column}"])
+        for column in ("name", "email", "phone", "course_name", "performance")
+    }
+    ids = decode(codes, dictionaries["student_id"])
+    print(f"✅ Loaded snapshot from {directory} "
+          f"({snapshot['manifest']['created_at']})")
+    return [
+        {
+            "id": ids[i],
+            "name": columns["name"][i],
+            "email": columns["email"][i],
+            "phone": columns["phone"][i],
+            "course_name": columns["course_name"][i],
+            "performance": columns["performance"][i],
+            "avg_score": None if np.isnan(avg_score[code]) else float(avg_score[code]),
+            "attendance_percentage": (
+                None if np.isnan(attendance_pct[code]) else float(attendance_pct[code])
+            )
+        }
+        for i, code in enumerate(codes)
+    ]
+
+
+def fetch_recommendations():
+    """
+    Fetch personalized recommendations for all students from the backend API
+    Returns a list of recommendation dicts or None if failed
+    """
+    try:
+        response = requests.get(f"{API_BASE_URL}/recommendations")
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Error fetching recommendations from API: {e}")
+        return None
+
+
 def create_dashboard(students_data):
     """
     Create the student dashboard visualization
@@ -277,44 +505,42 @@ def create_dashboard(students_data):
     print(f"Highest Attendance: {student_df['Attendance'].max()}% "
           f"({student_df.loc[student_df['Attendance'].idxmax()]['Name']})")
 
-    # Add personalized recommendations
+    # Add personalized recommendations (computed and cached by the backend)
     print("\n===== PERSONALIZED RECOMMENDATIONS =====")
-    for student in students_data:
-        sid = student['id']
-        if sid in sample_assignments:
-            student_assignments = sample_assignments[sid]
-            weakest_subject = min(student_assignments.items(), key=lambda x: x[1])
-            strongest_subject = max(student_assignments.items(), key=lambda x: x[1])
-            
-            attendance = student['attendance_percentage']
-            cgpa = student.get('avg_score', 0)
-            
-            print(f"\n{student['name']}:")
-            print(f"  - Focus on improving {weakest_subject[0]} "
-                  f"(score: {weakest_subject[1]})")
-            print(f"  - Maintain strength in {strongest_subject[0]} "
-                  f"(score: {strongest_subject[1]})")
-            
-            # Attendance recommendation
-            if attendance < 85:
-                print(f"  - Try to improve attendance (current: {attendance}%)")
-            elif attendance > 95:
-                print(f"  - Excellent attendance (current: {attendance}%) - keep it up!")
-            
-            # CGPA recommendation
-            if cgpa < 8.0:
-                print(f"  - Consider seeking academic guidance (CGPA: {cgpa:.1f})")
-            elif cgpa > 9.0:
-                print(f"  - Outstanding academic performance (CGPA: {cgpa:.1f})!")
+    recommendations = fetch_recommendations()
+    if recommendations is None:
+        print("Recommendations unavailable.")
+        return
+    for recommendation in recommendations:
+        print(f"\n{recommendation['name']}:")
+        for message in recommendation['messages']:
+            print(f"  - {message}")
 
 
 def main():
     """Main function to run the dashboard"""
+    parser = argparse.ArgumentParser(description="Student Dashboard Frontend")
+    parser.add_argument(
+        '--snapshot',
+        help="load data from a snapshot directory (see snapshot.py) instead of the API"
+    )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help="download the full dataset instead of syncing the local cache"
+    )
+    args = parser.parse_args()
+
     print("📊 Student Dashboard Frontend")
     print("=============================")
     
-    # Fetch data from backend
-    students_data = fetch_student_data()
+    # Fetch data from backend, or from an offline snapshot
+    if args.snapshot:
+        students_data = load_snapshot_data(args.snapshot)
+    elif args.full:
+        students_data = fetch_student_data()
+    else:
+        students_data = sync_student_data()
     
     if students_data:
         # Create and display the dashboard
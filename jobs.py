@@ -0,0 +1,358 @@
+import json
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class JobScheduler:
+    """
+    In-process background job scheduler.
+    Jobs are persisted in a SQLite `jobs` table so queued work survives
+    restarts, run on a worker thread pool, and are retried with exponential
+    backoff when their handler raises.
+    A running job holds a lease that its process renews while it runs. If
+    the lease expires (the process died) the job is queued again, so a job
+    runs at least once but may run more than once.
+    """
+
+    def __init__(self, connect, workers=4, poll_interval=1.0, retry_delay=5.0,
+                 lease=300.0):
+        self.connect = connect
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.handlers = {}
+        self.schedules = []
+        self._pool = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._running = {}  # job id -> attempt, for jobs this process runs
+        self._last_heartbeat = 0.0
+        self._table_ready = False
+
+    def _ensure_table(self):
+        """Create the jobs table on first use."""
+        if not self._table_ready:
+            self.create_table()
+
+    def create_table(self):
+        """Create the jobs table if the database does not have it yet."""
+        conn = self.connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            payload TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            run_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            heartbeat_at REAL,
+            finished_at REAL,
+            result TEXT,
+            error TEXT
+        )''')
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+        if 'heartbeat_at' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN heartbeat_at REAL')
+            conn.execute('UPDATE jobs SET heartbeat_at = started_at')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at '
+            'ON jobs (status, run_at)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_jobs_name_created_at '
+            'ON jobs (name, created_at)'
+        )
+        conn.commit()
+        conn.close()
+        self._table_ready = True
+
+    def register(self, name):
+        """Decorator registering a handler; it receives the job payload dict."""
+        def decorator(handler):
+            self.handlers[name] = handler
+            return handler
+        return decorator
+
+    def schedule(self, name, every, payload=None, hours=None):
+        """
+        Enqueue `name` every `every` seconds, counted from the last job
+        with that name in the table so restarts do not push runs back.
+        `hours=(start, end)` restricts runs to that local-hour window,
+        e.g. (1, 5) for off-hours maintenance; windows may wrap midnight.
+        """
+        self.schedules.append({
+            "name": name,
+            "every": every,
+            "payload": payload or {},
+            "hours": hours,
+            "next_run": None  # read from the jobs table on the first tick
+        })
+
+    def enqueue(self, name, payload=None, delay=0, max_attempts=3):
+        """Persist a new job and return its id."""
+        if name not in self.handlers:
+            raise ValueError(f"Unknown job: {name}")
+        self._ensure_table()
+        now = time.time()
+        conn = self.connect()
+        cursor = conn.execute(
+            'INSERT INTO jobs (name, payload, max_attempts, run_at, created_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (name, json.dumps(payload or {}), max_attempts, now + delay, now)
+        )
+        conn.commit()
+        conn.close()
+        self._wake.set()
+        return cursor.lastrowid
+
+    def enqueue_once(self, name, payload=None, delay=0):
+        """
+        Enqueue `name` unless a job with that name is already queued, and
+        return the id of the new or the waiting job. Meant for refresh jobs
+        requested on every write, where one pending run covers them all.
+        """
+        self._ensure_table()
+        conn = self.connect()
+        queued = conn.execute(
+            "SELECT id FROM jobs WHERE status = 'queued' AND name = ? LIMIT 1",
+            (name,)
+        ).fetchone()
+        conn.close()
+        if queued:
+            return queued[0]
+        return self.enqueue(name, payload, delay=delay)
+
+    def last_result(self, name):
+        """Return the most recent finished job with this name, or None."""
+        self._ensure_table()
+        conn = self.connect()
+        job = conn.execute(
+            "SELECT * FROM jobs WHERE name = ? AND status = 'done' "
+            "ORDER BY created_at DESC LIMIT 1",
+            (name,)
+        ).fetchone()
+        conn.close()
+        return self._to_dict(job) if job else None
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it does not exist."""
+        self._ensure_table()
+        conn = self.connect()
+        job = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        conn.close()
+        return self._to_dict(job) if job else None
+
+    def list(self, status=None, limit=50):
+        """Return the most recent jobs, optionally filtered by status."""
+        self._ensure_table()
+        conn = self.connect()
+        if status:
+            jobs = conn.execute(
+                'SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?',
+                (status, limit)
+            ).fetchall()
+        else:
+            jobs = conn.execute(
+                'SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,)
+            ).fetchall()
+        conn.close()
+        return [self._to_dict(job) for job in jobs]
+
+    def start(self):
+        """Start the dispatcher thread and worker pool (idempotent)."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._ensure_table()
+            self._stop.clear()
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='job'
+            )
+            self._thread = threading.Thread(
+                target=self._loop, name='job-dispatcher', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, wait=True):
+        """Stop dispatching new jobs and shut down the worker pool."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._pool.shutdown(wait=wait)
+        self._thread = None
+        self._pool = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                # Leases are checked a few times per lease period, not on
+                # every tick, to keep write locks on the database rare
+                if time.time() - self._last_heartbeat >= self.lease / 4:
+                    self._last_heartbeat = time.time()
+                    self._heartbeat()
+                    self._recover_expired()
+                self._enqueue_due_schedules()
+                self._dispatch()
+            except Exception:
+                traceback.print_exc()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _heartbeat(self):
+        """Renew the lease of every job this process is running."""
+        now = time.time()
+        with self._lock:
+            running = list(self._running.items())
+        if not running:
+            return
+        conn = self.connect()
+        conn.executemany(
+            "UPDATE jobs SET heartbeat_at = ? "
+            "WHERE id = ? AND attempts = ? AND status = 'running'",
+            [(now, job_id, attempt) for job_id, attempt in running]
+        )
+        conn.commit()
+        conn.close()
+
+    def _recover_expired(self):
+        """
+        Queue again the running jobs whose lease expired, i.e. whose
+        process stopped renewing it; fail those out of attempts.
+        """
+        expired = time.time() - self.lease
+        conn = self.connect()
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, "
+            "error = 'Lease expired on the last attempt' "
+            "WHERE status = 'running' AND heartbeat_at < ? "
+            "AND attempts >= max_attempts",
+            (time.time(), expired)
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', "
+            "error = 'Lease expired; queued again' "
+            "WHERE status = 'running' AND heartbeat_at < ?",
+            (expired,)
+        )
+        conn.commit()
+        conn.close()
+
+    def _enqueue_due_schedules(self):
+        now = time.time()
+        for entry in self.schedules:
+            if entry["next_run"] is None:
+                conn = self.connect()
+                last = conn.execute(
+                    'SELECT MAX(created_at) FROM jobs WHERE name = ?',
+                    (entry["name"],)
+                ).fetchone()[0]
+                conn.close()
+                # Never run: due now (or as soon as its window opens)
+                entry["next_run"] = now if last is None else last + entry["every"]
+            if now < entry["next_run"] or not self._in_window(entry["hours"]):
+                continue
+            entry["next_run"] = now + entry["every"]
+            conn = self.connect()
+            pending = conn.execute(
+                "SELECT 1 FROM jobs WHERE name = ? "
+                "AND status IN ('queued', 'running') LIMIT 1",
+                (entry["name"],)
+            ).fetchone()
+            conn.close()
+            # Skip this tick if the previous run has not finished yet
+            if not pending:
+                self.enqueue(entry["name"], entry["payload"])
+
+    @staticmethod
+    def _in_window(hours):
+        if hours is None:
+            return True
+        start, end = hours
+        hour = datetime.now().hour
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def _dispatch(self):
+        with self._lock:
+            free = self.workers - len(self._running)
+        if free <= 0:
+            return
+        conn = self.connect()
+        due = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' AND run_at <= ? "
+            "ORDER BY run_at LIMIT ?",
+            (time.time(), free)
+        ).fetchall()
+        for job in due:
+            # Claim atomically so only one process starts a queued job. The
+            # new attempt number fences this run: if its lease expires and
+            # another process takes the job over, this run's updates no
+            # longer match and are dropped
+            now = time.time()
+            claimed = conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, "
+                "heartbeat_at = ?, attempts = attempts + 1 "
+                "WHERE id = ? AND status = 'queued'",
+                (now, now, job['id'])
+            ).rowcount
+            conn.commit()
+            if claimed:
+                job = dict(job, attempts=job['attempts'] + 1)
+                with self._lock:
+                    self._running[job['id']] = job['attempts']
+                self._pool.submit(self._run, job)
+        conn.close()
+
+    def _run(self, job):
+        try:
+            handler = self.handlers[job['name']]
+            result = handler(json.loads(job['payload'] or '{}'))
+            self._finish(job, 'done', result=json.dumps(result, default=str))
+        except Exception as e:
+            attempts = job['attempts']
+            if attempts < job['max_attempts']:
+                backoff = self.retry_delay * 2 ** (attempts - 1)
+                self._finish(job, 'queued', error=str(e), retry_in=backoff)
+            else:
+                self._finish(job, 'failed', error=traceback.format_exc())
+        finally:
+            with self._lock:
+                del self._running[job['id']]
+            self._wake.set()
+
+    def _finish(self, job, status, result=None, error=None, retry_in=None):
+        conn = self.connect()
+        if retry_in is not None:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, run_at = ? "
+                "WHERE id = ? AND attempts = ? AND status = 'running'",
+                (status, error, time.time() + retry_in, job['id'], job['attempts'])
+            )
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND attempts = ? AND status = 'running'",
+                (status, result, error, time.time(), job['id'], job['attempts'])
+            )
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def _to_dict(job):
+        job = dict(job)
+        job['payload'] = json.loads(job['payload'] or '{}')
+        if job['result'] is not None:
+            job['result'] = json.loads(job['result'])
+        return job
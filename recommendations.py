@@ -0,0 +1,211 @@
+import threading
+from concurrent.futures import Future
+
+from changelog import current_seq
+
+# Thresholds used for the attendance and CGPA flags
+LOW_ATTENDANCE = 85
+EXCELLENT_ATTENDANCE = 95
+LOW_CGPA = 8.0
+OUTSTANDING_CGPA = 9.0
+
+# One set-based pass over a shard: per-subject averages ranked with window
+# functions, attendance aggregated per student, and the last two semesters
+# for the CGPA trend. Each part is collapsed to one row per student before
+# the final join so every join is a keyed lookup. {where} narrows every
+# part to one student for STUDENT_RECOMMENDATION_QUERY.
+_QUERY_TEMPLATE = '''
+    WITH subject_avg AS (
+        SELECT student_id, subject,
+               AVG(score * 100.0 / COALESCE(max_score, 100)) AS score
+        FROM assignments
+        {where}
+        GROUP BY student_id, subject
+    ),
+    ranked AS (
+        SELECT student_id, subject, score,
+               ROW_NUMBER() OVER (
+                   PARTITION BY student_id ORDER BY score, subject
+               ) AS weakest_rank,
+               ROW_NUMBER() OVER (
+                   PARTITION BY student_id ORDER BY score DESC, subject
+               ) AS strongest_rank
+        FROM subject_avg
+    ),
+    subjects AS (
+        SELECT student_id,
+               MAX(CASE WHEN weakest_rank = 1 THEN subject END) AS weakest_subject,
+               MAX(CASE WHEN weakest_rank = 1 THEN score END) AS weakest_score,
+               MAX(CASE WHEN strongest_rank = 1 THEN subject END) AS strongest_subject,
+               MAX(CASE WHEN strongest_rank = 1 THEN score END) AS strongest_score
+        FROM ranked
+        WHERE weakest_rank = 1 OR strongest_rank = 1
+        GROUP BY student_id
+    ),
+    attendance_pct AS (
+        SELECT student_id, AVG(present) * 100.0 AS attendance
+        FROM attendance
+        {where}
+        GROUP BY student_id
+    ),
+    cgpa_trend AS (
+        SELECT student_id, cgpa,
+               LAG(cgpa) OVER (
+                   PARTITION BY student_id ORDER BY semester
+               ) AS previous_cgpa,
+               ROW_NUMBER() OVER (
+                   PARTITION BY student_id ORDER BY semester DESC
+               ) AS recency
+        FROM semesters
+        {where}
+    ),
+    latest_cgpa AS (
+        SELECT student_id, cgpa, previous_cgpa
+        FROM cgpa_trend
+        WHERE recency = 1
+    )
+    SELECT s.id AS student_id, s.name,
+           w.weakest_subject, w.weakest_score,
+           w.strongest_subject, w.strongest_score,
+           a.attendance, t.cgpa, t.previous_cgpa
+    FROM students s
+    LEFT JOIN subjects w ON w.student_id = s.id
+    LEFT JOIN attendance_pct a ON a.student_id = s.id
+    LEFT JOIN latest_cgpa t ON t.student_id = s.id
+    {student_where}
+'''
+RECOMMENDATIONS_QUERY = _QUERY_TEMPLATE.format(where='', student_where='')
+STUDENT_RECOMMENDATION_QUERY = _QUERY_TEMPLATE.format(
+    where='WHERE student_id = :student_id',
+    student_where='WHERE s.id = :student_id'
+)
+
+# cache key -> (data version, results), plus the computations in progress
+# keyed by (cache key, data version) so concurrent misses share one
+_cache = {}
+_pending = {}
+_cache_lock = threading.Lock()
+
+
+def compute_recommendations(conn):
+    """
+    Compute recommendations for every student in one query.
+    Returns a dict mapping student id -> recommendation dict.
+    """
+    results = {}
+    for row in conn.execute(RECOMMENDATIONS_QUERY):
+        results[row['student_id']] = build_recommendation(row)
+    return results
+
+
+def build_recommendation(row):
+    """Turn one row of RECOMMENDATIONS_QUERY into flags and messages."""
+    flags = []
+    messages = []
+    if row['weakest_subject'] is not None:
+        messages.append(f"Focus on improving {row['weakest_subject']} "
+                        f"(score: {row['weakest_score']:.0f})")
+        messages.append(f"Maintain strength in {row['strongest_subject']} "
+                        f"(score: {row['strongest_score']:.0f})")
+
+    attendance = row['attendance']
+    if attendance is not None:
+        attendance = round(attendance, 2)
+        if attendance < LOW_ATTENDANCE:
+            flags.append('low_attendance')
+            messages.append(f"Try to improve attendance (current: {attendance}%)")
+        elif attendance > EXCELLENT_ATTENDANCE:
+            flags.append('excellent_attendance')
+            messages.append(f"Excellent attendance (current: {attendance}%) - keep it up!")
+
+    cgpa = row['cgpa']
+    trend = None
+    if cgpa is not None:
+        if cgpa < LOW_CGPA:
+            flags.append('low_cgpa')
+            messages.append(f"Consider seeking academic guidance (CGPA: {cgpa:.1f})")
+        elif cgpa > OUTSTANDING_CGPA:
+            flags.append('outstanding_cgpa')
+            messages.append(f"Outstanding academic performance (CGPA: {cgpa:.1f})!")
+        if row['previous_cgpa'] is not None:
+            delta = cgpa - row['previous_cgpa']
+            trend = 'improving' if delta > 0 else 'declining' if delta < 0 else 'steady'
+            if trend == 'declining':
+                flags.append('cgpa_declining')
+                messages.append(f"CGPA dropped from {row['previous_cgpa']:.1f} "
+                                f"to {cgpa:.1f} last semester")
+
+    return {
+        "student_id": row['student_id'],
+        "name": row['name'],
+        "weakest_subject": row['weakest_subject'],
+        "weakest_score": row['weakest_score'],
+        "strongest_subject": row['strongest_subject'],
+        "strongest_score": row['strongest_score'],
+        "attendance_percentage": attendance,
+        "cgpa": cgpa,
+        "cgpa_trend": trend,
+        "flags": flags,
+        "messages": messages
+    }
+
+
+def cached_recommendations(cache_key, conn, on_stale=None):
+    """
+    Return recommendations for a shard, recomputing only when its data
+    version has changed since the last computation. Concurrent callers
+    that miss on the same version wait for a single computation.
+    With `on_stale`, an outdated result is returned as is and on_stale()
+    is called to have it refreshed elsewhere; only a shard with no
+    result yet is computed by the caller.
+    """
+    version = current_seq(conn)
+    with _cache_lock:
+        cached = _cache.get(cache_key)
+        if cached and cached[0] == version:
+            return cached[1]
+        stale = cached is not None and on_stale is not None
+        if not stale:
+            future = _pending.get((cache_key, version))
+            computing = future is None
+            if computing:
+                future = _pending[(cache_key, version)] = Future()
+    if stale:
+        on_stale()
+        return cached[1]
+    if not computing:
+        return future.result()
+
+    try:
+        results = compute_recommendations(conn)
+    except BaseException as e:
+        with _cache_lock:
+            del _pending[(cache_key, version)]
+        future.set_exception(e)
+        raise
+    with _cache_lock:
+        del _pending[(cache_key, version)]
+        cached = _cache.get(cache_key)
+        # A slower computation for an older version must not replace a newer one
+        if not cached or cached[0] <= version:
+            _cache[cache_key] = (version, results)
+    future.set_result(results)
+    return results
+
+
+def student_recommendation(cache_key, conn, student_id):
+    """
+    Return one student's recommendation, or None if the shard has no such
+    student. Served from the cache while it is current; otherwise only that
+    student's rows are read, leaving the full refresh to the cache's next
+    caller or the recommendations job.
+    """
+    version = current_seq(conn)
+    with _cache_lock:
+        cached = _cache.get(cache_key)
+    if cached and cached[0] == version:
+        return cached[1].get(student_id)
+    row = conn.execute(
+        STUDENT_RECOMMENDATION_QUERY, {'student_id': student_id}
+    ).fetchone()
+    return build_recommendation(row) if row else None
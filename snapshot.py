@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# Column layout of each snapshot table. Kinds:
+#   'student_id' / 'subject' - int32 codes into a dictionary shared by all tables
+#   'text'                    - int32 codes into a per-column dictionary
+#   'datetime64[...]'         - parsed dates; unparseable text becomes NaT
+#   anything else             - a NumPy dtype stored as-is
+SCHEMA = {
+    'students': [
+        ('id', 'student_id'),
+        ('name', 'text'),
+        ('email', 'text'),
+        ('phone', 'text'),
+        ('course_name', 'text'),
+        ('performance', 'text')
+    ],
+    'assignments': [
+        ('student_id', 'student_id'),
+        ('subject', 'subject'),
+        ('score', 'float64'),
+        ('max_score', 'float64'),
+        ('assignment_date', 'datetime64[D]')
+    ],
+    'semesters': [
+        ('student_id', 'student_id'),
+        ('semester', 'int32'),
+        ('cgpa', 'float32')
+    ],
+    'attendance': [
+        ('student_id', 'student_id'),
+        ('date', 'datetime64[D]'),
+        ('present', 'bool')
+    ]
+}
+
+QUERIES = {
+    'students': '''
+        SELECT s.id, s.name, s.email, s.phone, c.name AS course_name,
+               s.performance
+        FROM students s
+        LEFT JOIN courses c ON s.course_id = c.id
+        ORDER BY s.id
+    ''',
+    'assignments': '''
+        SELECT student_id, subject, score, COALESCE(max_score, 100),
+               assignment_date
+        FROM assignments
+        ORDER BY student_id, assignment_date
+    ''',
+    'semesters': '''
+        SELECT student_id, semester, cgpa
+        FROM semesters
+        ORDER BY student_id, semester
+    ''',
+    'attendance': '''
+        SELECT student_id, date, COALESCE(present, 1)
+        FROM attendance
+        ORDER BY student_id, date
+    '''
+}
+
+
+def read_tables(database_paths):
+    """
+    Read the snapshot tables from one or more SQLite files (e.g. all shards).
+    Each file is read inside a single transaction so its tables are consistent.
+    Returns a dict mapping table -> list of rows.
+    """
+    rows = {table: [] for table in SCHEMA}
+    for path in database_paths:
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute('BEGIN')
+            for table, query in QUERIES.items():
+                rows[table].extend(conn.execute(query).fetchall())
+            conn.commit()
+        finally:
+            conn.close()
+    return rows
+
+
+def encode(values, index):
+    """Dictionary-encode values into int32 codes, extending index in place."""
+    return np.fromiter(
+        (-1 if v is None else index.setdefault(v, len(index)) for v in values),
+        dtype=np.int32,
+        count=len(values)
+    )
+
+
+def parse_dates(values, dtype):
+    """
+    Convert date strings to a datetime64 array. The API stores dates as
+    free text, so values that do not parse become NaT like NULLs do.
+    """
+    unit = np.datetime_data(np.dtype(dtype))[0]
+
+    def parse(value):
+        try:
+            return np.datetime64(value, unit)
+        except (TypeError, ValueError):
+            return np.datetime64('NaT', unit)
+    return np.array([parse(v) for v in values], dtype=dtype)
+
+
+def write_snapshot(database_paths, directory):
+    """
+    Write the four tables as one .npy file per column plus dictionaries
+    and a manifest.json, replacing any existing snapshot in `directory`.
+    """
+    rows = read_tables(database_paths)
+    tmp_dir = directory.rstrip('/\\') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    indexes = {'student_id': {}, 'subject': {}}
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "sources": [os.path.abspath(path) for path in database_paths],
+        "tables": {},
+        "dictionaries": []
+    }
+    for table, columns in SCHEMA.items():
+        table_rows = rows[table]
+        table_info = {"rows": len(table_rows), "columns": {}}
+        for position, (column, kind) in enumerate(columns):
+            values = [row[position] for row in table_rows]
+            if kind == 'text':
+                dictionary = f'{table}.{column}'
+                indexes[dictionary] = {}
+                array = encode(values, indexes[dictionary])
+            elif kind in indexes:
+                dictionary = kind
+                array = encode(values, indexes[kind])
+            elif kind.startswith('datetime64'):
+                dictionary = None
+                array = parse_dates(values, kind)
+            else:
+                dictionary = None
+                array = np.array(values, dtype=kind)
+            np.save(os.path.join(tmp_dir, f'{table}.{column}.npy'), array)
+            table_info["columns"][column] = {
+                "dtype": str(array.dtype),
+                "dictionary": dictionary
+            }
+        manifest["tables"][table] = table_info
+
+    for name, index in indexes.items():
+        # Fixed-width unicode arrays can be memory-mapped like the columns
+        np.save(
+            os.path.join(tmp_dir, f'dict.{name}.npy'),
+            np.array(list(index), dtype=str) if index else np.array([], dtype='<U1')
+        )
+        manifest["dictionaries"].append(name)
+
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap the finished snapshot into place so readers never see a partial one
+    old_dir = directory.rstrip('/\\') + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(directory):
+        os.rename(directory, old_dir)
+    os.rename(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def load_snapshot(directory):
+    """
+    Memory-map a snapshot without copying any column data.
+    Returns {"manifest": ..., "tables": {table: {column: array}},
+    "dictionaries": {name: array}}.
+    """
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest["format_version"] != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported snapshot format: {manifest['format_version']}"
+        )
+    tables = {
+        table: {
+            column: np.load(
+                os.path.join(directory, f'{table}.{column}.npy'), mmap_mode='r'
+            )
+            for column in info["columns"]
+        }
+        for table, info in manifest["tables"].items()
+    }
+    dictionaries = {
+        name: np.load(os.path.join(directory, f'dict.{name}.npy'), mmap_mode='r')
+        for name in manifest["dictionaries"]
+    }
+    return {"manifest": manifest, "tables": tables, "dictionaries": dictionaries}
+
+
+def decode(codes, dictionary):
+    """Map dictionary codes back to values (None where the value was NULL)."""
+    codes = np.asarray(codes)
+    values = np.full(codes.shape, None, dtype=object)
+    known = codes >= 0
+    # An all-NULL column has an empty dictionary, so only index known codes
+    if known.any():
+        values[known] = np.asarray(dictionary)[codes[known]]
+    return values
+
+
+def main():
+    """Write a snapshot from the command line"""
+    parser = argparse.ArgumentParser(
+        description="Write a memory-mappable snapshot of the student database"
+    )
+    parser.add_argument('output', help="snapshot directory to create or replace")
+    parser.add_argument(
+        'databases', nargs='*', default=['students.db'],
+        help="SQLite files to include (pass every shard for a full snapshot)"
+    )
+    args = parser.parse_args()
+    manifest = write_snapshot(args.databases, args.output)
+    for table, info in manifest["tables"].items():
+        print(f"{table}: {info['rows']} rows")
+    print(f"Snapshot written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
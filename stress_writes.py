@@ -0,0 +1,223 @@
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import app as backend
+import writes
+
+# Students created for the run; their phone field is used as a counter
+STUDENT_IDS = [f'stress{i:03d}' for i in range(64)]
+
+
+def worker(student_id, ops, stats, lock):
+    """
+    Perform `ops` rounds of: one optimistic increment of the student's
+    phone counter (GET + PUT with If-Match, retried on 412), one attendance
+    insert and one assignment insert
+    """
+    client = backend.app.test_client()
+    for _ in range(ops):
+        while True:
+            response = client.get(f'/api/student/{student_id}')
+            etag = response.headers['ETag']
+            value = int(response.get_json()['student']['phone'])
+            response = client.put(
+                f'/api/student/{student_id}',
+                json={'phone': str(value + 1)},
+                headers={'If-Match': etag}
+            )
+            if response.status_code == 200:
+                break
+            with lock:
+                if response.status_code == 412:
+                    stats['conflicts'] += 1
+                else:
+                    stats['errors'].append(response.get_json())
+            if response.status_code != 412:
+                break
+        for response in (
+            client.post(f'/api/student/{student_id}/attendance', json={'present': True}),
+            client.post('/api/assignments', json={
+                'student_id': student_id, 'subject': 'Stress', 'score': 50
+            })
+        ):
+            if response.status_code != 200:
+                with lock:
+                    stats['errors'].append(response.get_json())
+    with lock:
+        stats['writes'] += 3 * ops
+
+
+def count_rows(conn):
+    """Return the counters the stress run is expected to move"""
+    stress = conn.execute(
+        "SELECT SUM(CAST(phone AS INTEGER)), SUM(version) FROM students "
+        "WHERE id LIKE 'stress%'"
+    ).fetchone()
+    return {
+        "counter": stress[0],
+        "version": stress[1],
+        "attendance": conn.execute(
+            "SELECT COUNT(*) FROM attendance WHERE student_id LIKE 'stress%'"
+        ).fetchone()[0],
+        "assignments": conn.execute(
+            "SELECT COUNT(*) FROM assignments WHERE subject = 'Stress'"
+        ).fetchone()[0]
+    }
+
+
+def run(threads, ops, shared):
+    """
+    Run `threads` concurrent workers and check that no write was lost.
+    With `shared` every worker increments the same student, so most
+    optimistic updates conflict; otherwise each worker owns a student
+    """
+    backend.write_to_shard(backend.default_shard(), lambda conn: conn.execute(
+        "UPDATE students SET phone = '0' WHERE id LIKE 'stress%'"
+    ))
+    conn = backend.get_db_connection()
+    before = count_rows(conn)
+    conn.close()
+
+    stats = {"writes": 0, "conflicts": 0, "errors": []}
+    lock = threading.Lock()
+    workers = [
+        threading.Thread(
+            target=worker,
+            args=(STUDENT_IDS[0 if shared else i], ops, stats, lock)
+        )
+        for i in range(threads)
+    ]
+    start = time.perf_counter()
+    # The write handlers print debug logs on every request
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    conn = backend.get_db_connection()
+    after = count_rows(conn)
+    conn.close()
+    total = threads * ops
+    lost = {
+        "counter": total - after["counter"],
+        "version": total - (after["version"] - before["version"]),
+        "attendance": total - (after["attendance"] - before["attendance"]),
+        "assignments": total - (after["assignments"] - before["assignments"])
+    }
+    return {
+        "name": f"{threads} writer(s){', one shared row' if shared else ''}",
+        "threads": threads,
+        "throughput": stats["writes"] / elapsed,
+        "conflicts": stats["conflicts"],
+        "errors": stats["errors"],
+        "lost": {name: n for name, n in lost.items() if n}
+    }
+
+
+def run_locked():
+    """
+    Hold the write lock from an outside connection and check that a write
+    gives up with 503 within the retry budget, then succeeds once released
+    """
+    client = backend.app.test_client()
+    path = backend.app.config['SHARDS'][backend.default_shard()]
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            blocked = client.post(f'/api/student/{STUDENT_IDS[0]}/attendance',
+                                  json={'present': True})
+        elapsed = time.perf_counter() - start
+    finally:
+        blocker.execute('ROLLBACK')
+        blocker.close()
+    with contextlib.redirect_stdout(io.StringIO()):
+        released = client.post(f'/api/student/{STUDENT_IDS[0]}/attendance',
+                               json={'present': True})
+    return {
+        "blocked_status": blocked.status_code,
+        "elapsed": elapsed,
+        "released_status": released.status_code
+    }
+
+
+def main():
+    """Run the stress test from the command line"""
+    parser = argparse.ArgumentParser(
+        description="Concurrent write stress test: checks that no update is "
+                    "lost, that throughput holds as writers are added and that "
+                    "busy writes give up with 503 within the retry budget"
+    )
+    parser.add_argument('--threads', type=int, default=8, choices=range(2, len(STUDENT_IDS) + 1),
+                        metavar='N')
+    parser.add_argument('--ops', type=int, default=50, help="rounds per thread")
+    parser.add_argument(
+        '--min-ratio', type=float, default=0.5,
+        help="fail if concurrent throughput drops below this fraction of "
+             "single-writer throughput"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        backend.app.config['SHARDS'] = {'main': os.path.join(directory, 'stress.db')}
+        backend.app.config['RUN_JOBS'] = False
+        with contextlib.redirect_stdout(io.StringIO()):
+            backend.init_database()
+        backend.write_to_shard(backend.default_shard(), lambda conn: conn.executemany(
+            'INSERT INTO students (id, name, course_id) VALUES (?, ?, 1)',
+            [(student_id, student_id) for student_id in STUDENT_IDS]
+        ))
+
+        # Throughput is compared on independent rows; the shared-row run
+        # only has to lose nothing
+        results = [
+            run(1, args.ops, shared=False),
+            run(args.threads, args.ops, shared=False),
+            run(args.threads, args.ops, shared=True)
+        ]
+        for result in results:
+            print(f"{result['name']:<28} "
+                  f"{result['throughput']:8.1f} writes/s, "
+                  f"{result['conflicts']} version conflicts retried, "
+                  f"{len(result['errors'])} errors, lost: {result['lost'] or 'none'}")
+        locked = run_locked()
+        print(f"{'write lock held elsewhere':<28} "
+              f"{locked['blocked_status']} after {locked['elapsed']:.2f}s, "
+              f"{locked['released_status']} once released")
+
+    failures = []
+    for result in results:
+        if result['lost']:
+            failures.append(f"{result['name']} lost updates: {result['lost']}")
+        if result['errors']:
+            failures.append(f"{result['name']} errors: {result['errors'][:3]}")
+    ratio = results[1]['throughput'] / results[0]['throughput']
+    if ratio < args.min_ratio:
+        failures.append(f"throughput fell to {ratio:.0%} of single-writer throughput")
+    if locked['blocked_status'] != 503:
+        failures.append(f"write under a held lock returned {locked['blocked_status']}, not 503")
+    # Allow for the last attempt's busy wait and scheduling slack
+    if locked['elapsed'] > writes.MAX_WAIT + 2 * writes.BUSY_TIMEOUT + 0.5:
+        failures.append(f"write under a held lock waited {locked['elapsed']:.2f}s, "
+                        f"over the {writes.MAX_WAIT}s retry budget")
+    if locked['released_status'] != 200:
+        failures.append(f"write after the lock was released returned {locked['released_status']}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ No lost updates; busy writes give up within the retry budget")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import random
+import sqlite3
+import time
+
+# Bounded exponential backoff for writes that find the database busy
+MAX_RETRIES = 6
+BASE_DELAY = 0.01
+MAX_DELAY = 0.5
+# How long SQLite itself waits for the lock on each attempt, and the cap on
+# the total time a write may spend waiting before DatabaseBusy is raised
+BUSY_TIMEOUT = 0.05
+MAX_WAIT = 2.0
+
+
+class DatabaseBusy(Exception):
+    """Raised when a write still finds the database locked after all retries."""
+
+
+def is_busy(error):
+    """Return True if an OperationalError means SQLITE_BUSY / SQLITE_LOCKED."""
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def run_write(connect, work, retries=MAX_RETRIES, max_wait=MAX_WAIT):
+    """
+    Run work(conn) inside a BEGIN IMMEDIATE transaction and commit it.
+    Taking the write lock up front means a busy database fails fast at
+    BEGIN instead of midway through; busy failures are retried with jittered
+    exponential backoff. Each attempt waits at most BUSY_TIMEOUT for the
+    lock and the whole call gives up after max_wait seconds.
+    Returns whatever work returns.
+    """
+    deadline = time.monotonic() + max_wait
+    for attempt in range(retries + 1):
+        conn = connect()
+        conn.isolation_level = None  # transactions are managed explicitly
+        try:
+            # Replace the connection's default 5 s busy wait with a short one
+            remaining = max(deadline - time.monotonic(), 0)
+            conn.execute(f'PRAGMA busy_timeout = {int(min(BUSY_TIMEOUT, remaining) * 1000)}')
+            conn.execute('BEGIN IMMEDIATE')
+            result = work(conn)
+            conn.execute('COMMIT')
+            return result
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            if not is_busy(e):
+                raise
+            delay = min(BASE_DELAY * 2 ** attempt, MAX_DELAY) * random.uniform(0.5, 1.0)
+            if attempt == retries or time.monotonic() + delay >= deadline:
+                raise DatabaseBusy("Database is busy, please retry") from e
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        time.sleep(delay)